@@ -9,24 +9,129 @@ Versión: 3.0 (Fusión multimodal LiDAR + RGB)
 """
 
 import laspy
+from laspy.vlrs.known import LasZipVlr
 import numpy as np
+import plotly
 import plotly.graph_objects as go
+import plotly.colors
+import plotly.io as pio
 import matplotlib.pyplot as plt
 from pathlib import Path
 import os
+import pickle
+import struct
+import base64
+import hashlib
+import json
+import shutil
+import argparse
+import webbrowser
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 
 # Para leer ortofotografías TIFF
 try:
     import rasterio
-    from rasterio.transform import rowcol
+    from rasterio.windows import Window
     RASTERIO_AVAILABLE = True
 except ImportError:
     RASTERIO_AVAILABLE = False
     print("⚠️ Advertencia: rasterio no está instalado. Instala con: pip install rasterio")
 
+# Numba (opcional) para acelerar el muestreo RGB con un kernel compilado en paralelo
+try:
+    import numba
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+# SciPy (opcional) para el índice espacial KD-tree
+try:
+    from scipy.spatial import cKDTree
+    SCIPY_AVAILABLE = True
+except ImportError:
+    SCIPY_AVAILABLE = False
+
+# tqdm (opcional) para la barra de progreso
+try:
+    from tqdm import tqdm
+    TQDM_AVAILABLE = True
+except ImportError:
+    TQDM_AVAILABLE = False
+
 # Importar configuración
 import settings
 
+# Color gris (0xRRGGBB) para puntos sin datos RGB o fuera de la ortofoto
+NODATA_COLOR = 0x808080
+
+# Dígitos hexadecimales en ASCII para codificar colores sin bucles en Python
+HEX_DIGITS = np.frombuffer(b'0123456789abcdef', dtype=np.uint8)
+
+# Arrays binarios (typed arrays) en el HTML de Plotly en lugar de números como texto:
+# plotly.js >= 2.28 (plotly >= 5.19) entiende {'dtype', 'bdata'} y plotly >= 6 ya
+# codifica así los arrays NumPy por su cuenta
+PLOTLY_VERSION = tuple(int(part) for part in plotly.__version__.split('.')[:2])
+PLOTLY_SUPPORTS_TYPED_ARRAYS = PLOTLY_VERSION >= (5, 19)
+PLOTLY_NATIVE_TYPED_ARRAYS = PLOTLY_VERSION >= (6, 0)
+TYPED_ARRAY_DTYPES = {
+    np.dtype(np.int8): 'i1', np.dtype(np.uint8): 'u1',
+    np.dtype(np.int16): 'i2', np.dtype(np.uint16): 'u2',
+    np.dtype(np.int32): 'i4', np.dtype(np.uint32): 'u4',
+    np.dtype(np.float32): 'f4', np.dtype(np.float64): 'f8'
+}
+
+# Página deck.gl: PointCloudLayer en OrbitView con atributos binarios (typed arrays)
+DECKGL_HTML_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Nube de Puntos LiDAR</title>
+<script src="https://unpkg.com/deck.gl@~9.0.0/dist.min.js"></script>
+<style>
+  body { margin: 0; background: #111111; overflow: hidden; }
+  #title { position: absolute; top: 10px; left: 10px; z-index: 1; color: white; font-family: sans-serif; }
+</style>
+</head>
+<body>
+<div id="title"></div>
+<script>
+const config = __CONFIG__;
+
+function decodeBase64(b64, ArrayType) {
+  const binary = atob(b64);
+  const bytes = new Uint8Array(binary.length);
+  for (let i = 0; i < binary.length; i++) {
+    bytes[i] = binary.charCodeAt(i);
+  }
+  return new ArrayType(bytes.buffer);
+}
+
+document.getElementById('title').innerHTML = config.title;
+
+new deck.DeckGL({
+  views: new deck.OrbitView(),
+  initialViewState: config.viewState,
+  controller: true,
+  layers: [
+    new deck.PointCloudLayer({
+      id: 'nube-puntos',
+      data: {
+        length: config.length,
+        attributes: {
+          getPosition: {value: decodeBase64(config.positions, Float32Array), size: 3},
+          getColor: {value: decodeBase64(config.colors, Uint8Array), size: 3}
+        }
+      },
+      pointSize: config.pointSize,
+      sizeUnits: 'pixels'
+    })
+  ]
+});
+</script>
+</body>
+</html>
+"""
+
 
 def load_orthophoto(ortho_path):
     """
@@ -36,7 +141,7 @@ def load_orthophoto(ortho_path):
         ortho_path: Ruta al archivo de ortofotografía (.tif)
     
     Returns:
-        ortho_data: Diccionario con la imagen RGB y metadatos geoespaciales
+        ortho_data: Diccionario con el dataset abierto y metadatos geoespaciales
     """
     if not RASTERIO_AVAILABLE:
         print("❌ Error: rasterio no está instalado")
@@ -51,45 +156,214 @@ def load_orthophoto(ortho_path):
     print(f"{'='*60}")
     print(f"Archivo: {Path(ortho_path).name}")
     
+    src = None
     try:
-        with rasterio.open(ortho_path) as src:
-            # Leer bandas RGB (normalmente bandas 1, 2, 3)
-            red = src.read(1)
-            green = src.read(2)
-            blue = src.read(3)
-            
-            # Obtener transformación geoespacial
-            transform = src.transform
-            bounds = src.bounds
-            crs = src.crs
-            
-            ortho_data = {
-                'red': red,
-                'green': green,
-                'blue': blue,
-                'transform': transform,
-                'bounds': bounds,
-                'crs': crs,
-                'width': src.width,
-                'height': src.height
-            }
-            
-            print(f"\n📸 Información de ortofotografía:")
-            print(f"   Dimensiones: {src.width} x {src.height} píxeles")
-            print(f"   Bandas: {src.count}")
-            print(f"   Sistema de coordenadas: {crs}")
-            print(f"   Límites:")
-            print(f"     X: {bounds.left:.2f} a {bounds.right:.2f}")
-            print(f"     Y: {bounds.bottom:.2f} a {bounds.top:.2f}")
-            print(f"   Resolución: {transform.a:.4f} m/píxel")
-            
-            return ortho_data
-            
+        # Mantener el dataset abierto: las bandas se leen después por ventanas
+        src = rasterio.open(ortho_path)
+        
+        # Obtener transformación geoespacial
+        transform = src.transform
+        bounds = src.bounds
+        crs = src.crs
+        
+        # Transformación inversa (mundo -> píxel) precalculada una sola vez
+        inv = ~transform
+        
+        ortho_data = {
+            'dataset': src,
+            'transform': transform,
+            'inv_affine': (inv.a, inv.b, inv.c, inv.d, inv.e, inv.f),
+            'bounds': bounds,
+            'crs': crs,
+            'width': src.width,
+            'height': src.height
+        }
+        
+        print(f"\n📸 Información de ortofotografía:")
+        print(f"   Dimensiones: {src.width} x {src.height} píxeles")
+        print(f"   Bandas: {src.count}")
+        print(f"   Sistema de coordenadas: {crs}")
+        print(f"   Límites:")
+        print(f"     X: {bounds.left:.2f} a {bounds.right:.2f}")
+        print(f"     Y: {bounds.bottom:.2f} a {bounds.top:.2f}")
+        print(f"   Resolución: {transform.a:.4f} m/píxel")
+        
+        return ortho_data
+        
     except Exception as e:
         print(f"❌ Error al cargar ortofotografía: {e}")
+        if src is not None:
+            src.close()
         return None
 
 
+if NUMBA_AVAILABLE:
+    @numba.njit(parallel=True, cache=True, fastmath=True)
+    def _sample_rgb_numba(x, y, red, green, blue, a, b, c, d, e, f, h, w, nodata_values, out):
+        """
+        Kernel Numba: transforma, valida y copia el RGB de cada punto en una sola pasada
+        
+        Args:
+            x, y: Arrays de coordenadas del mundo real
+            red, green, blue: Bandas de la ortofotografía
+            a, b, c, d, e, f: Coeficientes de la transformación inversa (mundo -> píxel)
+            h, w: Alto y ancho de la imagen en píxeles
+            nodata_values: Colores no-data empaquetados como 0xRRGGBB (uint32)
+            out: Array (N, 3) uint8 donde se escriben los colores
+        
+        Returns:
+            valid_colors: Número de puntos con RGB válido
+        """
+        valid_colors = 0
+        for i in numba.prange(x.shape[0]):
+            col = int(np.floor(x[i] * a + y[i] * b + c))
+            row = int(np.floor(x[i] * d + y[i] * e + f))
+            
+            # Color gris por defecto para puntos fuera de la ortofoto o sin datos
+            packed = np.uint32(NODATA_COLOR)
+            
+            if 0 <= row < h and 0 <= col < w:
+                pixel = (np.uint32(red[row, col]) << 16) | (np.uint32(green[row, col]) << 8) | np.uint32(blue[row, col])
+                is_nodata = False
+                for value in nodata_values:
+                    if pixel == value:
+                        is_nodata = True
+                        break
+                if not is_nodata:
+                    packed = pixel
+                    valid_colors += 1
+            
+            out[i, 0] = (packed >> 16) & 0xFF
+            out[i, 1] = (packed >> 8) & 0xFF
+            out[i, 2] = packed & 0xFF
+        
+        return valid_colors
+
+
+def minmax(a):
+    """
+    Calcula el mínimo y el máximo de un array (dos reducciones de NumPy)
+    
+    Las reducciones vectorizadas superan a un bucle fusionado con Numba en int32 y
+    float32. La ganancia real está en las_axis_range, que reduce sobre los
+    enteros sin escalar del LAS y nunca materializa coordenadas float64.
+    
+    Args:
+        a: Array 1D
+    
+    Returns:
+        a_min, a_max: Mínimo y máximo del array
+    """
+    a = np.asarray(a)
+    return a.min(), a.max()
+
+
+def las_axis_range(las, axis):
+    """
+    Calcula el rango de un eje a partir de los enteros sin escalar del LAS
+    
+    Evita materializar las coordenadas escaladas en float64 sólo para el rango.
+    
+    Args:
+        las: Objeto laspy
+        axis: Eje ('x', 'y' o 'z')
+    
+    Returns:
+        axis_range: Tupla (mínimo, máximo) en coordenadas reales
+    """
+    index = 'xyz'.index(axis)
+    raw_min, raw_max = minmax(getattr(las, axis.upper()))
+    scale = las.header.scales[index]
+    offset = las.header.offsets[index]
+    return tuple(sorted((float(raw_min * scale + offset), float(raw_max * scale + offset))))
+
+
+def pack_rgb(r, g, b):
+    """
+    Empaqueta tres canales de 8 bits en un único uint32 0xRRGGBB
+    
+    Args:
+        r, g, b: Arrays de canales (valores 0-255)
+    
+    Returns:
+        packed: Array uint32 con los colores empaquetados
+    """
+    return (r.astype(np.uint32) << 16) | (g.astype(np.uint32) << 8) | b.astype(np.uint32)
+
+
+def unpack_rgb(packed, out):
+    """
+    Desempaqueta colores 0xRRGGBB en un array (N, 3) uint8
+    
+    Args:
+        packed: Array uint32 con los colores empaquetados
+        out: Array (N, 3) uint8 donde se escriben los canales
+    """
+    out[:, 0] = packed >> 16
+    out[:, 1] = (packed >> 8) & 0xFF
+    out[:, 2] = packed & 0xFF
+
+
+def get_nodata_values():
+    """Colores no-data configurados, empaquetados como uint32 0xRRGGBB"""
+    return np.unique(np.asarray(settings.RGB_NODATA_VALUES, dtype=np.uint32))
+
+
+def apply_rgb_nodata(rgb):
+    """
+    Sustituye por gris los colores no-data de un array RGB (en el mismo array)
+    
+    Args:
+        rgb: Array (N, 3) uint8 con valores RGB
+    
+    Returns:
+        valid_colors: Número de puntos con RGB válido
+    """
+    packed = pack_rgb(rgb[:, 0], rgb[:, 1], rgb[:, 2])
+    nodata = np.isin(packed, get_nodata_values())
+    packed[nodata] = NODATA_COLOR
+    unpack_rgb(packed, rgb)
+    
+    return len(rgb) - int(np.count_nonzero(nodata))
+
+
+def sample_rgb_numpy(x, y, red, green, blue, a, b, c, d, e, f, h, w, nodata_values, out):
+    """
+    Versión NumPy del kernel de muestreo RGB (cuando Numba no está disponible)
+    
+    Args:
+        x, y: Arrays de coordenadas del mundo real
+        red, green, blue: Bandas de la ortofotografía
+        a, b, c, d, e, f: Coeficientes de la transformación inversa (mundo -> píxel)
+        h, w: Alto y ancho de la imagen en píxeles
+        nodata_values: Colores no-data empaquetados como 0xRRGGBB (uint32)
+        out: Array (N, 3) uint8 donde se escriben los colores
+    
+    Returns:
+        valid_colors: Número de puntos con RGB válido
+    """
+    # Convertir coordenadas del mundo real a píxeles con la transformación inversa
+    cols = np.floor(a * x + b * y + c).astype(np.int64)
+    rows = np.floor(d * x + e * y + f).astype(np.int64)
+    
+    # Verificar que estén dentro de los límites de la imagen
+    in_bounds = (rows >= 0) & (rows < h) & (cols >= 0) & (cols < w)
+    
+    # Acotar índices para que la indexación sea válida (los puntos fuera se descartan después)
+    rows = np.clip(rows, 0, h - 1)
+    cols = np.clip(cols, 0, w - 1)
+    
+    # Un único uint32 por píxel: el test no-data es una sola comparación por valor
+    packed = pack_rgb(red[rows, cols], green[rows, cols], blue[rows, cols])
+    invalid = ~in_bounds | np.isin(packed, nodata_values)
+    
+    # Color gris por defecto para puntos fuera de la ortofoto o sin datos
+    packed[invalid] = NODATA_COLOR
+    unpack_rgb(packed, out)
+    
+    return len(packed) - int(np.count_nonzero(invalid))
+
+
 def sample_rgb_from_orthophoto(x_coords, y_coords, ortho_data):
     """
     Muestrea valores RGB de la ortofotografía para coordenadas XY dadas
@@ -100,65 +374,467 @@ def sample_rgb_from_orthophoto(x_coords, y_coords, ortho_data):
         ortho_data: Diccionario con datos de ortofotografía
     
     Returns:
-        rgb_colors: Lista de strings 'rgb(r,g,b)' para cada punto
+        rgb_colors: Array (N, 3) uint8 con los valores RGB de cada punto
     """
     print(f"\n{'='*60}")
     print(f"FUSIONANDO RGB DE ORTOFOTOGRAFÍA CON PUNTOS LIDAR")
     print(f"{'='*60}")
     
-    red_band = ortho_data['red']
-    green_band = ortho_data['green']
-    blue_band = ortho_data['blue']
-    transform = ortho_data['transform']
+    src = ortho_data['dataset']
+    x_coords = np.ascontiguousarray(x_coords, dtype=np.float64)
+    y_coords = np.ascontiguousarray(y_coords, dtype=np.float64)
+    
+    if len(x_coords) == 0:
+        return np.empty((0, 3), dtype=np.uint8)
+    
+    # Coeficientes de la transformación inversa: col = a*x + b*y + c ; row = d*x + e*y + f
+    ia, ib, ic, id_, ie, if_ = ortho_data['inv_affine']
+    
+    # Calcular la ventana de píxeles que cubre la extensión XY de la nube
+    x_min, x_max = minmax(x_coords)
+    y_min, y_max = minmax(y_coords)
+    corner_x = np.array([x_min, x_min, x_max, x_max])
+    corner_y = np.array([y_min, y_max, y_min, y_max])
+    corner_cols = np.floor(ia * corner_x + ib * corner_y + ic)
+    corner_rows = np.floor(id_ * corner_x + ie * corner_y + if_)
+    row_min = max(int(np.min(corner_rows)), 0)
+    row_max = min(int(np.max(corner_rows)) + 1, ortho_data['height'])
+    col_min = max(int(np.min(corner_cols)), 0)
+    col_max = min(int(np.max(corner_cols)) + 1, ortho_data['width'])
     
-    rgb_colors = []
+    if row_min >= row_max or col_min >= col_max:
+        # La nube no se solapa con la ortofoto - todo en gris
+        print(f"⚠️ Advertencia: La nube de puntos no se solapa con la ortofotografía")
+        rgb_colors = np.empty((len(x_coords), 3), dtype=np.uint8)
+        unpack_rgb(np.full(len(x_coords), NODATA_COLOR, dtype=np.uint32), rgb_colors)
+        return rgb_colors
+    
+    # Leer sólo la ventana necesaria de las bandas RGB (normalmente bandas 1, 2, 3)
+    window = Window(col_min, row_min, col_max - col_min, row_max - row_min)
+    red_band = src.read(1, window=window)
+    green_band = src.read(2, window=window)
+    blue_band = src.read(3, window=window)
+    height = row_max - row_min
+    width = col_max - col_min
+    
+    print(f"  Ventana leída: {width} x {height} píxeles "
+          f"({(width * height) / (ortho_data['width'] * ortho_data['height']) * 100:.1f}% de la imagen)")
+    
+    # Desplazar la traslación al origen de la ventana
+    ic -= col_min
+    if_ -= row_min
+    
+    # Procesar por bloques: limita los temporales y permite mostrar el progreso
+    sample_kernel = _sample_rgb_numba if NUMBA_AVAILABLE else sample_rgb_numpy
+    nodata_values = get_nodata_values()
+    rgb_colors = np.empty((len(x_coords), 3), dtype=np.uint8)
     valid_colors = 0
     
-    for i, (x, y) in enumerate(zip(x_coords, y_coords)):
-        try:
-            # Convertir coordenadas del mundo real a píxeles de la imagen
-            row, col = rowcol(transform, x, y)
-            
-            # Verificar que esté dentro de los límites de la imagen
-            if 0 <= row < ortho_data['height'] and 0 <= col < ortho_data['width']:
-                r = int(red_band[row, col])
-                g = int(green_band[row, col])
-                b = int(blue_band[row, col])
-                
-                # Verificar que no sea un valor no-data (típicamente 0 o 255)
-                if not (r == 0 and g == 0 and b == 0):
-                    rgb_colors.append(f'rgb({r},{g},{b})')
-                    valid_colors += 1
-                else:
-                    # Color por defecto si es no-data
-                    rgb_colors.append('rgb(128,128,128)')
-            else:
-                # Punto fuera de la ortofoto - color gris
-                rgb_colors.append('rgb(128,128,128)')
-                
-        except Exception:
-            # En caso de error, usar gris
-            rgb_colors.append('rgb(128,128,128)')
-        
-        # Mostrar progreso cada 10%
-        if (i + 1) % (len(x_coords) // 10 + 1) == 0:
-            progress = ((i + 1) / len(x_coords)) * 100
-            print(f"   Procesando: {progress:.0f}% completado", end='\r')
+    chunk_size = settings.RGB_SAMPLING_CHUNK_SIZE
+    starts = range(0, len(x_coords), chunk_size)
+    if TQDM_AVAILABLE:
+        starts = tqdm(starts, desc="   Procesando", unit="bloque")
+    
+    for start in starts:
+        end = min(start + chunk_size, len(x_coords))
+        valid_colors += sample_kernel(
+            x_coords[start:end], y_coords[start:end],
+            red_band, green_band, blue_band,
+            ia, ib, ic, id_, ie, if_,
+            height, width, nodata_values, rgb_colors[start:end]
+        )
+        if not TQDM_AVAILABLE:
+            print(f"   Procesando: {(end / len(x_coords)) * 100:.0f}% completado", end='\r')
     
-    print(f"\n✓ Fusión completada")
+    if not TQDM_AVAILABLE:
+        print()
+    print(f"✓ Fusión completada")
     print(f"  Puntos con RGB válido: {valid_colors:,} ({(valid_colors/len(x_coords))*100:.1f}%)")
     print(f"  Puntos sin RGB: {len(x_coords) - valid_colors:,}")
     
     return rgb_colors
 
 
-def load_las_file(file_path, max_points=None):
+def rgb_to_hex(rgb):
+    """
+    Convierte un array de colores RGB a strings hexadecimales '#rrggbb'
+    
+    Args:
+        rgb: Array (N, 3) uint8 con valores RGB
+    
+    Returns:
+        hex_colors: Array de strings '#rrggbb' (uno por punto)
+    """
+    rgb = np.asarray(rgb, dtype=np.uint8)
+    
+    # Construir los 7 caracteres ASCII de cada color en un único buffer
+    buffer = np.empty((len(rgb), 7), dtype=np.uint8)
+    buffer[:, 0] = ord('#')
+    buffer[:, 1::2] = HEX_DIGITS[rgb >> 4]
+    buffer[:, 2::2] = HEX_DIGITS[rgb & 0x0F]
+    
+    return buffer.view('S7').ravel().astype('U7')
+
+
+def compute_ground_elevation(las):
+    """
+    Calcula la elevación mínima de los puntos clasificados como suelo
+    
+    Args:
+        las: Objeto laspy (o bloque de puntos) con clasificación
+    
+    Returns:
+        ground_elevation: Elevación mínima del suelo (None si no hay puntos de suelo)
+    """
+    if not hasattr(las, 'classification'):
+        return None
+    
+    ground_points = np.asarray(las.classification) == settings.GROUND_CLASS
+    if not np.any(ground_points):
+        return None
+    
+    # Mínimo enmascarado (where=) sobre los enteros Z sin escalar: no se crea ni el
+    # subconjunto de Z del suelo ni el array Z escalado en float64
+    record = las.points if isinstance(las, laspy.LasData) else las
+    raw_z = np.asarray(record.Z)
+    raw_min = np.min(raw_z, where=ground_points, initial=np.iinfo(raw_z.dtype).max)
+    
+    return float(raw_min * record.scales[2] + record.offsets[2])
+
+
+def keep_smallest_keys(points, keys, max_points):
+    """
+    Conserva los max_points puntos con las claves aleatorias más pequeñas
+    
+    Args:
+        points: Array estructurado de registros LAS
+        keys: Array de claves aleatorias (una por punto)
+        max_points: Número máximo de puntos a conservar
+    
+    Returns:
+        points, keys: Registros y claves conservados
+    """
+    if len(keys) > max_points:
+        keep = np.argpartition(keys, max_points - 1)[:max_points]
+        return points[keep], keys[keep]
+    return points, keys
+
+
+def classification_mask(classification, classes_to_keep):
+    """
+    Máscara de los puntos cuya clasificación está entre las clases a mantener
+    
+    Args:
+        classification: Array de clasificaciones LAS (uint8)
+        classes_to_keep: Lista de clases a mantener
+    
+    Returns:
+        mask: Array booleano
+    """
+    # Tabla de consulta de 256 entradas: la clasificación LAS es un uint8
+    lut = np.zeros(256, dtype=np.bool_)
+    lut[np.asarray(classes_to_keep, dtype=np.uint8)] = True
+    return lut[np.asarray(classification)]
+
+
+def window_mask(x, y, window):
+    """
+    Máscara de los puntos dentro de una ventana XY (límites incluidos)
+    
+    Args:
+        x, y: Arrays de coordenadas
+        window: Tupla (xmin, ymin, xmax, ymax)
+    
+    Returns:
+        mask: Array booleano
+    """
+    xmin, ymin, xmax, ymax = window
+    return (x >= xmin) & (x <= xmax) & (y >= ymin) & (y <= ymax)
+
+
+def sample_las_range(file_path, start, count, max_points, classes_to_keep=None, window=None, laz_backend=None):
+    """
+    Lee un rango de puntos de un archivo LAS/LAZ, lo filtra y lo muestrea
+    
+    Se ejecuta tanto en el proceso principal como en los procesos de
+    decodificación LAZ, por lo que recibe toda la configuración como argumentos.
+    
+    Args:
+        file_path: Ruta al archivo LAS/LAZ
+        start: Índice del primer punto del rango
+        count: Número de puntos del rango
+        max_points: Número máximo de puntos a conservar
+        classes_to_keep: Lista de clases a mantener (None = todas)
+        window: Tupla (xmin, ymin, xmax, ymax) a mantener (None = toda la nube)
+        laz_backend: Backend LAZ de laspy (None = el predeterminado)
+    
+    Returns:
+        points: Array estructurado con los registros conservados
+        keys: Claves aleatorias de los registros conservados
+        ground_elevation: Elevación mínima del suelo en el rango (o None)
+    """
+    open_kwargs = {} if laz_backend is None else {'laz_backend': laz_backend}
+    
+    with laspy.open(file_path, **open_kwargs) as reader:
+        if start > 0:
+            reader.seek(start)
+        chunk = reader.read_points(count)
+        has_classification = 'classification' in reader.header.point_format.dimension_names
+    
+    # Elevación del suelo sobre todos los puntos (antes de filtrar)
+    ground_elevation = compute_ground_elevation(chunk)
+    
+    mask = np.ones(len(chunk), dtype=np.bool_)
+    if classes_to_keep is not None and has_classification:
+        mask &= classification_mask(chunk.classification, classes_to_keep)
+    if window is not None:
+        mask &= window_mask(np.asarray(chunk.x), np.asarray(chunk.y), window)
+    
+    points = chunk.array[mask]
+    keys = np.random.default_rng().random(len(points))
+    points, keys = keep_smallest_keys(points, keys, max_points)
+    
+    return points, keys, ground_elevation
+
+
+def get_laz_chunk_size(header):
+    """
+    Obtiene el tamaño de bloque (en puntos) de la compresión LAZ
+    
+    Args:
+        header: Cabecera laspy de un archivo LAZ
+    
+    Returns:
+        chunk_size: Puntos por bloque LAZ (50.000 si no se puede determinar)
+    """
+    for vlr in header.vlrs:
+        if isinstance(vlr, LasZipVlr) and len(vlr.record_data) >= 16:
+            # Registro laszip: compresor, codificador, versión, opciones y tamaño de bloque
+            chunk_size = struct.unpack_from('<I', vlr.record_data, 12)[0]
+            if 0 < chunk_size < 0xFFFFFFFF:
+                return chunk_size
+    return 50_000
+
+
+def stream_las_file(file_path, max_points, classes_to_keep=None, window=None):
+    """
+    Lee un archivo LAS/LAZ por bloques, filtrando y muestreando sobre la marcha
+    
+    Cada punto que pasa los filtros recibe una clave aleatoria y se conservan las
+    max_points claves menores: es una muestra uniforme sin reemplazo y la memoria
+    queda acotada a max_points registros más los rangos en curso.
+    
+    Los archivos LAZ se decodifican en paralelo: cada bloque de compresión tiene
+    un estado independiente, así que los rangos (alineados a esos bloques) se
+    reparten entre procesos con ProcessPoolExecutor. Sólo hay unos pocos rangos
+    en curso por proceso, para no acumular resultados pendientes de combinar.
+    
+    Args:
+        file_path: Ruta al archivo LAS/LAZ
+        max_points: Número máximo de puntos a conservar
+        classes_to_keep: Lista de clases a mantener (None = todas)
+        window: Tupla (xmin, ymin, xmax, ymax) a mantener (None = toda la nube)
+    
+    Returns:
+        las: Objeto laspy con los puntos conservados
+        total_points: Número total de puntos del archivo
+        ground_elevation: Elevación mínima del suelo en todo el archivo (o None)
+    """
+    with laspy.open(file_path) as reader:
+        header = reader.header
+    
+    total_points = header.point_count
+    is_laz = header.are_points_compressed
+    
+    # Dividir el archivo en rangos de ~LAS_CHUNK_SIZE puntos (alineados a bloques LAZ)
+    range_size = settings.LAS_CHUNK_SIZE
+    if is_laz:
+        laz_chunk_size = get_laz_chunk_size(header)
+        range_size = max(laz_chunk_size, (range_size // laz_chunk_size) * laz_chunk_size)
+    ranges = [(start, min(range_size, total_points - start)) for start in range(0, total_points, range_size)]
+    
+    kept_points = np.empty(0, dtype=header.point_format.dtype())
+    kept_keys = np.empty(0, dtype=np.float64)
+    ground_elevation = None
+    read_points = 0
+    
+    def merge(result, count):
+        nonlocal kept_points, kept_keys, ground_elevation, read_points
+        points, keys, range_ground = result
+        kept_points, kept_keys = keep_smallest_keys(
+            np.concatenate([kept_points, points]), np.concatenate([kept_keys, keys]), max_points
+        )
+        if range_ground is not None:
+            ground_elevation = range_ground if ground_elevation is None else min(ground_elevation, range_ground)
+        read_points += count
+        print(f"   Leyendo: {(read_points / total_points) * 100:.0f}% completado", end='\r')
+    
+    workers = settings.LAZ_DECODE_WORKERS or os.cpu_count() or 1
+    if is_laz and len(ranges) > 1 and workers > 1:
+        print(f"   Decodificando LAZ en paralelo: {len(ranges)} rangos, {workers} procesos")
+        # Cada proceso usa el decodificador lazrs de un solo hilo para no sobresuscribir núcleos
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending_ranges = iter(ranges)
+            futures = {}
+            
+            def submit_next():
+                for start, count in pending_ranges:
+                    future = executor.submit(
+                        sample_las_range, file_path, start, count, max_points,
+                        classes_to_keep, window, laspy.LazBackend.Lazrs
+                    )
+                    futures[future] = count
+                    return
+            
+            for _ in range(2 * workers):
+                submit_next()
+            
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    # Soltar el futuro (y su resultado) en cuanto se combina
+                    count = futures.pop(future)
+                    merge(future.result(), count)
+                    submit_next()
+    else:
+        for start, count in ranges:
+            merge(sample_las_range(file_path, start, count, max_points, classes_to_keep, window), count)
+    
+    print()
+    
+    points = laspy.ScaleAwarePointRecord(kept_points, header.point_format, header.scales, header.offsets)
+    las = laspy.LasData(header=header, points=points)
+    
+    print(f"✓ Lectura por bloques completada")
+    print(f"  Puntos conservados: {len(las.points):,} de {total_points:,}")
+    
+    return las, total_points, ground_elevation
+
+
+def get_las_cache_dir(file_path, max_points, classes_to_keep, window, ground_class):
+    """
+    Calcula la carpeta de caché para un archivo LAS/LAZ y sus parámetros de carga
+    
+    Args:
+        file_path: Ruta al archivo LAS/LAZ
+        max_points: Número máximo de puntos cargados
+        classes_to_keep: Clases mantenidas al cargar
+        window: Ventana espacial aplicada al cargar
+        ground_class: Clase de suelo usada para la elevación guardada en la caché
+    
+    Returns:
+        cache_dir: Ruta de la carpeta de caché
+    """
+    key = repr((
+        os.path.abspath(file_path),
+        os.path.getmtime(file_path),
+        max_points,
+        list(classes_to_keep) if classes_to_keep is not None else None,
+        tuple(window) if window is not None else None,
+        ground_class
+    ))
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(settings.CACHE_DIR, f"{Path(file_path).stem}_{digest}")
+
+
+def load_las_cache(file_path, cache_dir):
+    """
+    Carga los puntos de la caché mapeados en memoria (sin decodificar el LAS/LAZ)
+    
+    Args:
+        file_path: Ruta al archivo LAS/LAZ (sólo se lee su cabecera)
+        cache_dir: Carpeta de caché
+    
+    Returns:
+        (las, meta): Objeto laspy y metadatos guardados, o None si no hay caché
+    """
+    points_path = os.path.join(cache_dir, 'points.npy')
+    meta_path = os.path.join(cache_dir, 'meta.json')
+    if not (os.path.exists(points_path) and os.path.exists(meta_path)):
+        return None
+    
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        with laspy.open(file_path) as reader:
+            header = reader.header
+        
+        # Sólo las páginas que se usen se leen de disco
+        array = np.load(points_path, mmap_mode='r')
+        points = laspy.ScaleAwarePointRecord(array, header.point_format, header.scales, header.offsets)
+        las = laspy.LasData(header=header, points=points)
+    except Exception as e:
+        print(f"⚠️ Advertencia: No se pudo leer la caché ({e}), se leerá el archivo")
+        return None
+    
+    print(f"✓ Puntos cargados desde caché: {cache_dir}")
+    return las, meta
+
+
+def prune_las_cache(file_path, mode, keep_dir):
+    """
+    Elimina las carpetas de caché anteriores del mismo archivo LAS/LAZ y modo
+    
+    Args:
+        file_path: Ruta al archivo LAS/LAZ
+        mode: Modo de carga ('full' o 'streamed') de la caché que se guarda
+        keep_dir: Carpeta de caché que se conserva
+    """
+    source = os.path.abspath(file_path)
+    stem = Path(file_path).stem
+    
+    for entry in Path(settings.CACHE_DIR).glob(f"{stem}_*"):
+        if entry.name == Path(keep_dir).name:
+            continue
+        try:
+            with open(entry / 'meta.json', 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta.get('source') != source or meta.get('mode') != mode:
+                continue
+        except (OSError, ValueError):
+            continue
+        shutil.rmtree(entry, ignore_errors=True)
+
+
+def save_las_cache(las, cache_dir, meta):
+    """
+    Guarda los puntos cargados y sus metadatos en la caché
+    
+    Se conserva una caché por archivo y modo de carga (lectura completa o por
+    bloques): las carpetas anteriores del mismo archivo y modo (otros parámetros
+    o una versión antigua) se eliminan.
+    
+    Args:
+        las: Objeto laspy con los puntos cargados
+        cache_dir: Carpeta de caché
+        meta: Diccionario de metadatos (serializable a JSON)
+    """
+    try:
+        prune_las_cache(meta['source'], meta['mode'], cache_dir)
+        os.makedirs(cache_dir, exist_ok=True)
+        np.save(os.path.join(cache_dir, 'points.npy'), las.points.array)
+        # Los metadatos se escriben al final: su presencia marca la caché como completa
+        with open(os.path.join(cache_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        print(f"💾 Puntos guardados en caché: {cache_dir}")
+    except OSError as e:
+        print(f"⚠️ Advertencia: No se pudo guardar la caché: {e}")
+
+
+def load_las_file(file_path, max_points=None, classes_to_keep=None, window=None):
     """
     Carga un archivo LAS/LAZ y retorna la información básica
     
+    Con max_points, el archivo se lee por bloques y sólo se conservan en memoria
+    los puntos muestreados (ver stream_las_file). Si settings.USE_CACHE está
+    activo, el resultado se guarda en settings.CACHE_DIR y las siguientes
+    ejecuciones lo cargan mapeado en memoria sin volver a decodificar el archivo.
+    
     Args:
         file_path: Ruta al archivo LAS/LAZ
         max_points: Número máximo de puntos a cargar (None = todos)
+        classes_to_keep: Lista de clases a mantener al leer por bloques (None = todas)
+        window: Ventana (xmin, ymin, xmax, ymax) a mantener al leer por bloques (None = toda)
     
     Returns:
         las: Objeto laspy con los datos
@@ -169,20 +845,63 @@ def load_las_file(file_path, max_points=None):
     print(f"{'='*60}")
     print(f"Archivo: {Path(file_path).name}")
     
-    # Leer archivo
-    las = laspy.read(file_path)
+    # Buscar primero en la caché (puntos ya decodificados, filtrados y muestreados)
+    cache_dir = None
+    cached = None
+    if settings.USE_CACHE:
+        if max_points is None:
+            # La lectura completa no filtra ni calcula el suelo: la clave sólo depende del archivo
+            cache_dir = get_las_cache_dir(file_path, None, None, None, None)
+        else:
+            cache_dir = get_las_cache_dir(file_path, max_points, classes_to_keep, window, settings.GROUND_CLASS)
+        cached = load_las_cache(file_path, cache_dir)
+    
+    if cached is not None:
+        las, meta = cached
+        num_points = meta['num_points']
+        ground_elevation = meta['ground_elevation']
+        x_range = tuple(meta['x_range'])
+        y_range = tuple(meta['y_range'])
+        z_range = tuple(meta['z_range'])
+    elif max_points is None:
+        # Leer archivo completo
+        las = laspy.read(file_path)
+        num_points = len(las.points)
+        ground_elevation = None
+        x_range = las_axis_range(las, 'x')
+        y_range = las_axis_range(las, 'y')
+        z_range = las_axis_range(las, 'z')
+    else:
+        # Leer por bloques: los rangos se toman de la cabecera
+        las, num_points, ground_elevation = stream_las_file(file_path, max_points, classes_to_keep, window)
+        x_range = (las.header.x_min, las.header.x_max)
+        y_range = (las.header.y_min, las.header.y_max)
+        z_range = (las.header.z_min, las.header.z_max)
+    
+    if cache_dir is not None and cached is None:
+        save_las_cache(las, cache_dir, {
+            'source': os.path.abspath(file_path),
+            'mode': 'full' if max_points is None else 'streamed',
+            'num_points': int(num_points),
+            'ground_elevation': ground_elevation,
+            'x_range': [float(v) for v in x_range],
+            'y_range': [float(v) for v in y_range],
+            'z_range': [float(v) for v in z_range]
+        })
     
     # Información básica
     info = {
-        'num_points': len(las.points),
+        'num_points': num_points,
         'version': str(las.header.version),
         'point_format': las.header.point_format.id,
         'has_rgb': hasattr(las, 'red') and hasattr(las, 'green') and hasattr(las, 'blue'),
         'has_classification': hasattr(las, 'classification'),
         'has_intensity': hasattr(las, 'intensity'),
-        'x_range': (np.min(las.x), np.max(las.x)),
-        'y_range': (np.min(las.y), np.max(las.y)),
-        'z_range': (np.min(las.z), np.max(las.z))
+        'x_range': x_range,
+        'y_range': y_range,
+        'z_range': z_range,
+        'streamed': max_points is not None,
+        'ground_elevation': ground_elevation
     }
     
     # Imprimir información
@@ -223,12 +942,201 @@ def filter_points_by_classification(las, classes_to_keep):
         print("⚠️  Advertencia: No hay información de clasificación")
         return np.arange(len(las.points))
     
-    mask = np.isin(las.classification, classes_to_keep)
-    indices = np.where(mask)[0]
+    indices = np.flatnonzero(classification_mask(las.classification, classes_to_keep))
     
     print(f"\n🔍 Filtrado por clasificación:")
     print(f"   Clases seleccionadas: {classes_to_keep}")
-    print(f"   Puntos filtrados: {len(indices):,} ({(len(indices)/len(las.points))*100:.1f}%)")
+    print(f"   Puntos filtrados: {len(indices):,} ({(len(indices)/max(len(las.points), 1))*100:.1f}%)")
+    
+    return indices
+
+
+class SpatialIndex:
+    """
+    Índice espacial (KD-tree) sobre las coordenadas XY de un archivo LAS
+    
+    Si settings.USE_CACHE está activo, el árbol se guarda en settings.CACHE_DIR y
+    se reutiliza mientras el archivo no cambie (misma fecha de modificación y
+    mismo número de puntos).
+    """
+    
+    def __init__(self, las, file_path):
+        """
+        Args:
+            las: Objeto laspy
+            file_path: Ruta al archivo LAS/LAZ (clave de la caché)
+        """
+        self.las = las
+        self.file_path = file_path
+        self.cache_path = os.path.join(settings.CACHE_DIR, f"{Path(file_path).stem}_kdtree.pkl")
+        self.tree = self._load_or_build()
+    
+    def _cache_key(self):
+        return (os.path.abspath(self.file_path), os.path.getmtime(self.file_path), len(self.las.points))
+    
+    def _load_or_build(self):
+        key = self._cache_key()
+        
+        if settings.USE_CACHE and os.path.exists(self.cache_path):
+            try:
+                with open(self.cache_path, 'rb') as f:
+                    cached_key, tree = pickle.load(f)
+                if cached_key == key:
+                    print(f"✓ Índice espacial cargado desde caché: {self.cache_path}")
+                    return tree
+            except Exception as e:
+                print(f"⚠️ Advertencia: No se pudo leer el índice espacial en caché: {e}")
+        
+        print(f"\n🌳 Construyendo índice espacial (KD-tree) sobre {len(self.las.points):,} puntos...")
+        tree = cKDTree(np.column_stack([self.las.x, self.las.y]))
+        
+        if not settings.USE_CACHE:
+            return tree
+        
+        try:
+            os.makedirs(settings.CACHE_DIR, exist_ok=True)
+            with open(self.cache_path, 'wb') as f:
+                pickle.dump((key, tree), f, protocol=pickle.HIGHEST_PROTOCOL)
+        except OSError as e:
+            print(f"⚠️ Advertencia: No se pudo guardar el índice espacial: {e}")
+        
+        return tree
+
+
+def select_window(tree, xmin, ymin, xmax, ymax):
+    """
+    Selecciona los puntos dentro de una ventana XY usando el KD-tree
+    
+    Args:
+        tree: cKDTree construido sobre las coordenadas XY
+        xmin, ymin, xmax, ymax: Límites de la ventana
+    
+    Returns:
+        indices: Array ordenado de índices de puntos dentro de la ventana
+    """
+    # Consulta con distancia de Chebyshev (p=inf): el "radio" es un cuadrado
+    center = [(xmin + xmax) / 2, (ymin + ymax) / 2]
+    radius = max(xmax - xmin, ymax - ymin) / 2
+    indices = np.asarray(tree.query_ball_point(center, radius, p=np.inf, return_sorted=True), dtype=np.int64)
+    
+    # Recortar al rectángulo exacto (el cuadrado puede ser mayor que la ventana)
+    xy = tree.data[indices]
+    inside = window_mask(xy[:, 0], xy[:, 1], (xmin, ymin, xmax, ymax))
+    
+    return indices[inside]
+
+
+def filter_points_by_window(las, window, file_path, available_indices):
+    """
+    Filtra puntos según una ventana XY
+    
+    Args:
+        las: Objeto laspy
+        window: Tupla (xmin, ymin, xmax, ymax) en coordenadas del LAS
+        file_path: Ruta al archivo LAS/LAZ (para la caché del índice)
+        available_indices: Array de índices disponibles
+    
+    Returns:
+        indices: Array de índices dentro de la ventana
+    """
+    xmin, ymin, xmax, ymax = window
+    
+    if SCIPY_AVAILABLE:
+        index = SpatialIndex(las, file_path)
+        window_indices = select_window(index.tree, xmin, ymin, xmax, ymax)
+    else:
+        print("⚠️ Advertencia: scipy no está instalado, filtrando la ventana sin índice espacial")
+        window_indices = np.flatnonzero(window_mask(np.asarray(las.x), np.asarray(las.y), window))
+    
+    indices = np.intersect1d(available_indices, window_indices, assume_unique=True)
+    
+    print(f"\n🗺️ Filtrado por ventana espacial:")
+    print(f"   Ventana: X={xmin:.2f} a {xmax:.2f}, Y={ymin:.2f} a {ymax:.2f}")
+    print(f"   Puntos en ventana: {len(indices):,} ({(len(indices)/max(len(las.points), 1))*100:.1f}%)")
+    
+    return indices
+
+
+def voxel_downsample(x, y, z, voxel_size):
+    """
+    Reduce la nube a un punto por celda 3D (vóxel)
+    
+    Args:
+        x, y, z: Arrays de coordenadas
+        voxel_size: Tamaño del vóxel en metros
+    
+    Returns:
+        indices: Posiciones (en x, y, z) del primer punto de cada vóxel
+    """
+    ix = np.floor((x - np.min(x)) / voxel_size).astype(np.int64)
+    iy = np.floor((y - np.min(y)) / voxel_size).astype(np.int64)
+    iz = np.floor((z - np.min(z)) / voxel_size).astype(np.int64)
+    
+    if max(ix.max(initial=0), iy.max(initial=0), iz.max(initial=0)) < (1 << 21):
+        # Empaquetar las tres coordenadas del vóxel en una sola clave (21 bits por eje)
+        key = (ix << 42) | (iy << 21) | iz
+        _, first = np.unique(key, return_index=True)
+    else:
+        # Demasiadas celdas para 21 bits: agrupar por filas (más lento, sin colisiones)
+        _, first = np.unique(np.stack([ix, iy, iz], axis=1), axis=0, return_index=True)
+    
+    return first
+
+
+def heightmap_downsample(x, y, z, cell_size):
+    """
+    Reduce la nube al punto más alto de cada celda 2D (mapa de alturas)
+    
+    Args:
+        x, y, z: Arrays de coordenadas
+        cell_size: Tamaño de la celda en metros
+    
+    Returns:
+        indices: Posiciones (en x, y, z) del punto más alto de cada celda
+    """
+    ix = np.floor((x - np.min(x)) / cell_size).astype(np.int64)
+    iy = np.floor((y - np.min(y)) / cell_size).astype(np.int64)
+    key = (ix << 32) | iy
+    
+    # Ordenar por celda y, dentro de cada celda, por Z descendente
+    order = np.lexsort((-z, key))
+    sorted_key = key[order]
+    is_first = np.ones(len(order), dtype=np.bool_)
+    is_first[1:] = sorted_key[1:] != sorted_key[:-1]
+    
+    return order[is_first]
+
+
+def downsample_points(las, available_indices, mode, voxel_size):
+    """
+    Reduce los puntos disponibles con una rejilla de vóxeles o un mapa de alturas
+    
+    Args:
+        las: Objeto laspy
+        available_indices: Array de índices disponibles
+        mode: 'voxel' (un punto por celda 3D) o 'heightmap' (máximo Z por celda 2D)
+        voxel_size: Tamaño de la celda en metros
+    
+    Returns:
+        indices: Array de índices seleccionados
+    """
+    x = np.asarray(las.x[available_indices])
+    y = np.asarray(las.y[available_indices])
+    z = np.asarray(las.z[available_indices])
+    
+    if mode == 'voxel':
+        selected = voxel_downsample(x, y, z, voxel_size)
+    elif mode == 'heightmap':
+        selected = heightmap_downsample(x, y, z, voxel_size)
+    else:
+        raise ValueError(f"Modo de reducción desconocido: {mode}")
+    
+    indices = available_indices[selected]
+    
+    print(f"\n🧊 Reducción por {'vóxeles' if mode == 'voxel' else 'mapa de alturas'}:")
+    print(f"   Tamaño de celda: {voxel_size} m")
+    print(f"   Puntos: {len(available_indices):,} → {len(indices):,} "
+          f"({(len(indices)/max(len(available_indices), 1))*100:.1f}%)")
     
     return indices
 
@@ -253,11 +1161,15 @@ def sample_points(total_indices, max_points):
     print(f"   Total disponible: {total_points:,}")
     print(f"   Muestra seleccionada: {max_points:,} ({(max_points/total_points)*100:.1f}%)")
     
-    selected_indices = np.random.choice(total_indices, max_points, replace=False)
+    # Generator.choice sin reemplazo no genera una permutación completa de total_points
+    # cuando max_points << total_points (usa un conjunto de índices ya elegidos)
+    rng = np.random.default_rng()
+    picks = rng.choice(total_points, size=max_points, replace=False, shuffle=False)
+    selected_indices = total_indices[picks]
     return selected_indices
 
 
-def prepare_point_cloud_data(las, indices, ortho_data=None):
+def prepare_point_cloud_data(las, indices, ortho_data=None, ground_elevation=None):
     """
     Prepara los datos de la nube de puntos para visualización
     
@@ -265,6 +1177,7 @@ def prepare_point_cloud_data(las, indices, ortho_data=None):
         las: Objeto laspy
         indices: Índices de puntos a incluir
         ortho_data: Diccionario con datos de ortofotografía (opcional)
+        ground_elevation: Elevación del suelo ya calculada (None = calcularla desde las)
     
     Returns:
         data: Diccionario con coordenadas, colores e información
@@ -273,21 +1186,23 @@ def prepare_point_cloud_data(las, indices, ortho_data=None):
     print(f"PREPARANDO DATOS PARA VISUALIZACIÓN")
     print(f"{'='*60}")
     
-    # Extraer coordenadas ORIGINALES (antes de centrar)
-    x_original = las.x[indices]
-    y_original = las.y[indices]
-    z = las.z[indices]
+    # Extraer coordenadas ORIGINALES (antes de centrar); se centran más tarde en el mismo buffer
+    x = np.asarray(las.x[indices], dtype=np.float64)
+    y = np.asarray(las.y[indices], dtype=np.float64)
+    z = np.asarray(las.z[indices], dtype=np.float64)
     
     # Normalizar altura si está configurado
-    ground_elevation = 0
-    if settings.NORMALIZE_HEIGHT and hasattr(las, 'classification'):
-        ground_points = las.classification == settings.GROUND_CLASS
-        if np.sum(ground_points) > 0:
-            ground_elevation = np.min(las.z[ground_points])
-            z = z - ground_elevation
+    if settings.NORMALIZE_HEIGHT:
+        if ground_elevation is None:
+            ground_elevation = compute_ground_elevation(las)
+        if ground_elevation is not None:
+            np.subtract(z, ground_elevation, out=z)
             print(f"✓ Altura normalizada (suelo en Z=0)")
             print(f"  Elevación del suelo: {ground_elevation:.2f} m")
     
+    # Las alturas caben en float32 sin pérdida apreciable (mitad de memoria y de JSON)
+    z = z.astype(np.float32)
+    
     # Preparar colores
     colors = None
     color_array = None
@@ -297,18 +1212,25 @@ def prepare_point_cloud_data(las, indices, ortho_data=None):
     # Prioridad 1: Usar ortofotografía externa si está disponible
     if ortho_data is not None and RASTERIO_AVAILABLE:
         print(f"\n🎨 Aplicando colores desde ortofotografía TIFF...")
-        colors = sample_rgb_from_orthophoto(x_original, y_original, ortho_data)
+        colors = sample_rgb_from_orthophoto(x, y, ortho_data)
         color_source = "ortofotografía"
         
     # Prioridad 2: Usar RGB del archivo LAS si existe
     elif hasattr(las, 'red') and hasattr(las, 'green') and hasattr(las, 'blue'):
         print(f"\n🎨 Usando colores RGB del archivo LAS...")
-        r = (las.red[indices] / settings.RGB_MAX_VALUE * 255).astype(int)
-        g = (las.green[indices] / settings.RGB_MAX_VALUE * 255).astype(int)
-        b = (las.blue[indices] / settings.RGB_MAX_VALUE * 255).astype(int)
-        colors = [f'rgb({ri},{gi},{bi})' for ri, gi, bi in zip(r, g, b)]
+        # Escalar a 8 bits con aritmética entera directamente sobre un único buffer (N, 3)
+        colors = np.empty((len(indices), 3), dtype=np.uint8)
+        for channel, band in enumerate((las.red, las.green, las.blue)):
+            values = band[indices]
+            if settings.RGB_MAX_VALUE == 65535:
+                # 16 -> 8 bits: basta con desplazar (sin temporales en coma flotante)
+                colors[:, channel] = values >> 8
+            else:
+                colors[:, channel] = values.astype(np.uint32) * 255 // settings.RGB_MAX_VALUE
+        valid_colors = apply_rgb_nodata(colors)
         color_source = "RGB en LAS"
         print(f"✓ Colores RGB del archivo LAS aplicados")
+        print(f"  Puntos sin RGB: {len(indices) - valid_colors:,}")
         
     # Prioridad 3: Colorear por altura
     else:
@@ -318,32 +1240,35 @@ def prepare_point_cloud_data(las, indices, ortho_data=None):
         color_source = "altura"
         print(f"✓ Colores por altura aplicados (colormap: {settings.HEIGHT_COLORMAP})")
     
-    # Centrar coordenadas DESPUÉS de obtener RGB (para visualización)
-    x = x_original
-    y = y_original
-    x_center = 0
-    y_center = 0
-    
+    # Centrar coordenadas DESPUÉS de obtener RGB (la ortofoto necesita las
+    # coordenadas del mundo real en float64)
     if settings.CENTER_COORDINATES:
-        x_center = np.mean(x_original)
-        y_center = np.mean(y_original)
-        x = x_original - x_center
-        y = y_original - y_center
+        x_center = np.mean(x)
+        y_center = np.mean(y)
+        # Centrar en el mismo buffer y, ya centradas, pasar a float32
+        # (conserva precisión milimétrica con la mitad de memoria)
+        np.subtract(x, x_center, out=x)
+        np.subtract(y, y_center, out=y)
+        x = x.astype(np.float32)
+        y = y.astype(np.float32)
         print(f"\n✓ Coordenadas centradas en origen")
         print(f"  Centro original: X={x_center:.2f}, Y={y_center:.2f}")
     
-    # Información adicional para hover
-    hover_text = []
-    for i in range(len(indices)):
-        text = f"X: {x[i]:.2f} m<br>Y: {y[i]:.2f} m<br>Z: {z[i]:.2f} m"
-        
-        if hasattr(las, 'classification'):
-            text += f"<br>Clase: {las.classification[indices[i]]}"
-        
-        if hasattr(las, 'intensity'):
-            text += f"<br>Intensidad: {las.intensity[indices[i]]}"
-        
-        hover_text.append(text)
+    # Información adicional para hover: Plotly formatea el texto en el navegador.
+    # X/Y/Z se leen de la propia traza; customdata sólo lleva clase e intensidad
+    hover_columns = []
+    hovertemplate = 'X: %{x:.2f} m<br>Y: %{y:.2f} m<br>Z: %{z:.2f} m'
+    
+    if hasattr(las, 'classification'):
+        hovertemplate += f'<br>Clase: %{{customdata[{len(hover_columns)}]}}'
+        hover_columns.append(las.classification[indices])
+    
+    if hasattr(las, 'intensity'):
+        hovertemplate += f'<br>Intensidad: %{{customdata[{len(hover_columns)}]}}'
+        hover_columns.append(las.intensity[indices])
+    
+    hovertemplate += '<extra></extra>'
+    customdata = np.column_stack(hover_columns).astype(np.uint16) if hover_columns else None
     
     data = {
         'x': x,
@@ -352,7 +1277,8 @@ def prepare_point_cloud_data(las, indices, ortho_data=None):
         'colors': colors,
         'color_array': color_array,
         'colorscale': colorscale,
-        'hover_text': hover_text,
+        'customdata': customdata,
+        'hovertemplate': hovertemplate,
         'num_points': len(indices),
         'color_source': color_source
     }
@@ -360,9 +1286,12 @@ def prepare_point_cloud_data(las, indices, ortho_data=None):
     print(f"\n✓ Datos preparados:")
     print(f"  Puntos procesados: {data['num_points']:,}")
     print(f"  Fuente de color: {color_source}")
-    print(f"  Rango X: {np.min(x):.2f} a {np.max(x):.2f} m")
-    print(f"  Rango Y: {np.min(y):.2f} a {np.max(y):.2f} m")
-    print(f"  Rango Z: {np.min(z):.2f} a {np.max(z):.2f} m")
+    x_min, x_max = minmax(x)
+    y_min, y_max = minmax(y)
+    z_min, z_max = minmax(z)
+    print(f"  Rango X: {x_min:.2f} a {x_max:.2f} m")
+    print(f"  Rango Y: {y_min:.2f} a {y_max:.2f} m")
+    print(f"  Rango Z: {z_min:.2f} a {z_max:.2f} m")
     
     return data
 
@@ -382,6 +1311,9 @@ def create_plotly_figure(data, title):
     print(f"CREANDO VISUALIZACIÓN INTERACTIVA")
     print(f"{'='*60}")
     
+    # Colores RGB (N, 3) uint8 codificados una sola vez como strings hexadecimales
+    colors = rgb_to_hex(data['colors']) if data['colors'] is not None else None
+    
     # Crear scatter 3D
     scatter = go.Scatter3d(
         x=data['x'],
@@ -390,7 +1322,7 @@ def create_plotly_figure(data, title):
         mode='markers',
         marker=dict(
             size=settings.POINT_SIZE,
-            color=data['colors'] if data['colors'] is not None else data['color_array'],
+            color=colors if colors is not None else data['color_array'],
             colorscale=data['colorscale'] if data['color_array'] is not None else None,
             showscale=data['color_array'] is not None,
             colorbar=dict(
@@ -399,8 +1331,8 @@ def create_plotly_figure(data, title):
             ) if data['color_array'] is not None else None,
             opacity=0.8
         ),
-        text=data['hover_text'],
-        hovertemplate='%{text}<extra></extra>',
+        customdata=data['customdata'],
+        hovertemplate=data['hovertemplate'],
         name='Puntos LiDAR'
     )
     
@@ -437,6 +1369,145 @@ def create_plotly_figure(data, title):
     return fig
 
 
+def height_to_rgb(values, colorscale):
+    """
+    Convierte valores (alturas) a colores RGB con una escala de colores de Plotly
+    
+    Args:
+        values: Array de valores a colorear
+        colorscale: Nombre de la escala de colores de Plotly (ej. 'Earth')
+    
+    Returns:
+        rgb: Array (N, 3) uint8 con los colores
+    """
+    # Tabla de 256 colores muestreada una sola vez de la escala (tuplas normalizadas 0-1)
+    lut = plotly.colors.convert_colors_to_same_type(
+        plotly.colors.sample_colorscale(colorscale, np.linspace(0, 1, 256)), colortype='tuple'
+    )[0]
+    lut = np.rint(np.array(lut) * 255).astype(np.uint8)
+    
+    values = np.asarray(values, dtype=np.float64)
+    v_min, v_max = minmax(values)
+    scale = 255 / (v_max - v_min) if v_max > v_min else 0
+    
+    return lut[np.clip((values - v_min) * scale, 0, 255).astype(np.uint8)]
+
+
+def create_deckgl_html(data, title):
+    """
+    Crea una página HTML deck.gl (WebGL nativo) con la nube de puntos
+    
+    Las posiciones (float32, relativas al centro de la nube) y los colores (uint8)
+    se incrustan como atributos binarios de deck.gl codificados en base64, sin
+    objetos por punto ni JSON numérico: la página ocupa ~20 bytes por punto.
+    La librería deck.gl se carga desde unpkg, así que abrirla requiere conexión.
+    
+    Args:
+        data: Diccionario con datos preparados
+        title: Título de la visualización
+    
+    Returns:
+        html: Página HTML
+    """
+    print(f"\n{'='*60}")
+    print(f"CREANDO VISUALIZACIÓN DECK.GL")
+    print(f"{'='*60}")
+    
+    if data['colors'] is not None:
+        colors = data['colors']
+    else:
+        colors = height_to_rgb(data['color_array'], data['colorscale'])
+    
+    # Restar el centro en float64 antes de pasar a float32: con coordenadas sin
+    # centrar (Y ~ 6.4e6) float32 sólo resuelve ~0.5 m
+    positions = np.column_stack([data['x'], data['y'], data['z']]).astype(np.float64)
+    center = positions.mean(axis=0) if len(positions) else np.zeros(3)
+    positions = (positions - center).astype(np.float32)
+    colors = np.ascontiguousarray(colors, dtype=np.uint8)
+    
+    # La cámara apunta al centro (el origen de las posiciones) con zoom según la extensión
+    extent = float(np.ptp(positions[:, :2], axis=0).max()) if len(positions) else 1.0
+    zoom = float(np.log2(0.6 * min(settings.WINDOW_WIDTH, settings.WINDOW_HEIGHT) / max(extent, 1e-6)))
+    
+    config = {
+        'title': title,
+        'length': len(positions),
+        'positions': base64.b64encode(positions.tobytes()).decode('ascii'),
+        'colors': base64.b64encode(colors.tobytes()).decode('ascii'),
+        'pointSize': settings.POINT_SIZE,
+        'viewState': {
+            'target': [0.0, 0.0, 0.0],
+            'zoom': zoom,
+            'rotationX': 30,
+            'rotationOrbit': 30
+        }
+    }
+    
+    # JSON compacto; "</" escapado para no cerrar la etiqueta <script>
+    config_json = json.dumps(config, separators=(',', ':')).replace('</', '<\\/')
+    html = DECKGL_HTML_TEMPLATE.replace('__CONFIG__', config_json)
+    
+    print(f"✓ Visualización deck.gl creada exitosamente")
+    
+    return html
+
+
+def encode_typed_array(values):
+    """
+    Codifica un array NumPy como typed array de plotly.js (base64)
+    
+    Args:
+        values: Array NumPy 1D o 2D
+    
+    Returns:
+        typed_array: Diccionario {'dtype', 'bdata'[, 'shape']} o el array original
+                     si su tipo no está soportado
+    """
+    values = np.ascontiguousarray(values)
+    if values.dtype not in TYPED_ARRAY_DTYPES or values.ndim > 2:
+        return values
+    
+    typed_array = {
+        'dtype': TYPED_ARRAY_DTYPES[values.dtype],
+        'bdata': base64.b64encode(values.tobytes()).decode('ascii')
+    }
+    if values.ndim == 2:
+        typed_array['shape'] = f"{values.shape[0]}, {values.shape[1]}"
+    
+    return typed_array
+
+
+def figure_for_output(fig):
+    """
+    Prepara la figura para escribirla/mostrarla con arrays binarios
+    
+    Con plotly >= 6 (codificación nativa) o < 5.19 (sin soporte) se devuelve la
+    figura tal cual; en otro caso se devuelve su diccionario con las coordenadas,
+    customdata y colores numéricos convertidos a typed arrays.
+    
+    Args:
+        fig: Figura de Plotly
+    
+    Returns:
+        output: Figura o diccionario listo para plotly.io (con validate=False)
+    """
+    if PLOTLY_NATIVE_TYPED_ARRAYS or not PLOTLY_SUPPORTS_TYPED_ARRAYS:
+        return fig
+    
+    fig_dict = fig.to_dict()
+    for trace in fig_dict['data']:
+        for key in ('x', 'y', 'z', 'customdata'):
+            if isinstance(trace.get(key), np.ndarray):
+                trace[key] = encode_typed_array(trace[key])
+        
+        # Sólo los colores numéricos (por altura); los RGB son strings '#rrggbb'
+        marker = trace.get('marker', {})
+        if isinstance(marker.get('color'), np.ndarray) and marker['color'].dtype.kind in 'iuf':
+            marker['color'] = encode_typed_array(marker['color'])
+    
+    return fig_dict
+
+
 def print_visualization_instructions():
     """Imprime las instrucciones de uso de la visualización"""
     print(f"\n{'='*60}")
@@ -466,16 +1537,19 @@ def visualize_point_cloud(fig, file_name):
     """
     print_visualization_instructions()
     
+    # Coordenadas como arrays binarios (mucho más compactos que números en texto)
+    output = figure_for_output(fig)
+    
     # Guardar HTML si está configurado
     if settings.SAVE_HTML:
-        fig.write_html(settings.HTML_OUTPUT_PATH)
+        pio.write_html(output, settings.HTML_OUTPUT_PATH, validate=False)
         print(f"💾 Visualización guardada en: {settings.HTML_OUTPUT_PATH}")
     
     # Mostrar en navegador
     print(f"🚀 Abriendo visualización en el navegador...")
     print(f"   (La ventana puede tardar unos segundos en cargar)")
     
-    fig.show(config={
+    pio.show(output, validate=False, config={
         'displayModeBar': True,
         'displaylogo': False,
         'modeBarButtonsToRemove': ['select2d', 'lasso2d']
@@ -484,6 +1558,24 @@ def visualize_point_cloud(fig, file_name):
     print(f"\n✓ Visualización mostrada")
 
 
+def visualize_deckgl(html):
+    """
+    Guarda y muestra la visualización deck.gl
+    
+    Args:
+        html: Página HTML creada por create_deckgl_html
+    """
+    print(f"\n🚀 Guardando visualización deck.gl...")
+    with open(settings.DECKGL_HTML_OUTPUT_PATH, 'w', encoding='utf-8') as f:
+        f.write(html)
+    print(f"💾 Visualización guardada en: {settings.DECKGL_HTML_OUTPUT_PATH}")
+    
+    if settings.AUTO_OPEN_BROWSER:
+        webbrowser.open(Path(settings.DECKGL_HTML_OUTPUT_PATH).resolve().as_uri())
+    
+    print(f"\n✓ Visualización mostrada")
+
+
 def main():
     """Función principal"""
     print("\n" + "="*60)
@@ -500,12 +1592,20 @@ def main():
         print("\n⚠️ Advertencia: Algunas rutas no son válidas")
         print("   Continuando con las rutas disponibles...")
     
+    ortho_data = None
     try:
-        # 1. Cargar archivo LAS/LAZ
-        las, info = load_las_file(settings.LAZ_FILE_PATH)
+        # 1. Cargar archivo LAS/LAZ (por bloques si hay límite de puntos y
+        #    muestreo aleatorio; la reducción por vóxeles necesita la nube completa)
+        classes_to_keep = settings.CLASSES_TO_SHOW if settings.FILTER_BY_CLASSIFICATION else None
+        stream_max_points = settings.MAX_POINTS_VISUALIZATION if settings.DOWNSAMPLE_MODE == 'random' else None
+        las, info = load_las_file(
+            settings.LAZ_FILE_PATH,
+            max_points=stream_max_points,
+            classes_to_keep=classes_to_keep,
+            window=settings.VIEW_WINDOW
+        )
         
-        # 2. Cargar ortofotografía RGB (si existe)
-        ortho_data = None
+        # 2. Cargar ortofotografía RGB (si existe); se cierra en el bloque finally
         if os.path.exists(settings.ORTHO_FILE_PATH):
             ortho_data = load_orthophoto(settings.ORTHO_FILE_PATH)
             if ortho_data:
@@ -516,25 +1616,52 @@ def main():
             print(f"   Se usarán colores alternativos (RGB del LAS o por altura)")
         
         # 3. Filtrar por clasificación si está configurado
-        if settings.FILTER_BY_CLASSIFICATION and info['has_classification']:
+        #    (la lectura por bloques ya lo aplica al leer)
+        if settings.FILTER_BY_CLASSIFICATION and info['has_classification'] and not info['streamed']:
             available_indices = filter_points_by_classification(las, settings.CLASSES_TO_SHOW)
         else:
             available_indices = np.arange(len(las.points))
         
-        # 4. Muestrear puntos si es necesario
+        # 4. Recortar a la ventana espacial si está configurada
+        #    (la lectura por bloques ya la aplica al leer)
+        if settings.VIEW_WINDOW is not None and not info['streamed']:
+            available_indices = filter_points_by_window(
+                las, settings.VIEW_WINDOW, settings.LAZ_FILE_PATH, available_indices
+            )
+        
+        if len(available_indices) == 0:
+            if settings.VIEW_WINDOW is not None:
+                print(f"\n❌ Error: no hay puntos en la ventana {settings.VIEW_WINDOW}")
+                print(f"   Verifica VIEW_WINDOW en settings.py (coordenadas del LAS)")
+            else:
+                print(f"\n❌ Error: no hay puntos de las clases seleccionadas")
+                print(f"   Verifica CLASSES_TO_SHOW en settings.py")
+            return
+        
+        # 5. Reducir por vóxeles / mapa de alturas y muestrear puntos si es necesario
+        if settings.DOWNSAMPLE_MODE != 'random':
+            available_indices = downsample_points(
+                las, available_indices, settings.DOWNSAMPLE_MODE, settings.VOXEL_SIZE
+            )
         indices = sample_points(available_indices, settings.MAX_POINTS_VISUALIZATION)
         
-        # 5. Preparar datos (con fusión RGB si hay ortofoto)
-        data = prepare_point_cloud_data(las, indices, ortho_data)
+        # 6. Preparar datos (con fusión RGB si hay ortofoto)
+        data = prepare_point_cloud_data(las, indices, ortho_data, info['ground_elevation'])
         
-        # 6. Crear figura
+        # 7. Crear figura
         color_info = f" - Colores: {data['color_source']}"
         title = f"Nube de Puntos LiDAR: {Path(settings.PLOT_FILE).name}<br>" \
                 f"<sub>{data['num_points']:,} puntos visualizados{color_info}</sub>"
-        fig = create_plotly_figure(data, title)
-        
-        # 7. Visualizar
-        visualize_point_cloud(fig, settings.LAZ_FILE)
+        if settings.RENDER_BACKEND == 'deckgl':
+            html = create_deckgl_html(data, title)
+            
+            # 8. Visualizar
+            visualize_deckgl(html)
+        else:
+            fig = create_plotly_figure(data, title)
+            
+            # 8. Visualizar
+            visualize_point_cloud(fig, settings.LAZ_FILE)
         
         print("\n" + "="*60)
         print("✅ PROCESO COMPLETADO EXITOSAMENTE")
@@ -549,7 +1676,20 @@ def main():
         print(f"\n❌ Error inesperado: {e}")
         import traceback
         traceback.print_exc()
+    
+    finally:
+        # Cerrar la ortofotografía (abierta para las lecturas por ventanas) en cualquier caso
+        if ortho_data is not None:
+            ortho_data['dataset'].close()
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Visualizador 3D de nubes de puntos LiDAR")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="No leer ni escribir la caché (puntos decodificados e índice espacial)")
+    args = parser.parse_args()
+    
+    if args.no_cache:
+        settings.USE_CACHE = False
+    
     main()
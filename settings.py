@@ -35,6 +35,20 @@ ORTHO_FILE_PATH= os.path.join(ORTHO_PATH, ORTHO_FILE)
 # Número máximo de puntos a visualizar (para rendimiento en navegador)
 MAX_POINTS_VISUALIZATION = 200000  # Plotly funciona bien hasta 200k-500k puntos
 
+# Puntos leídos por bloque cuando el archivo se lee por partes
+# (sólo si MAX_POINTS_VISUALIZATION no es None)
+LAS_CHUNK_SIZE = 1_000_000
+
+# Procesos para decodificar archivos LAZ en paralelo (None = todos los núcleos)
+LAZ_DECODE_WORKERS = None
+
+# Reducción de puntos: 'random' (muestreo aleatorio), 'voxel' (un punto por celda 3D)
+# o 'heightmap' (el punto más alto de cada celda 2D, recomendado para datos aéreos)
+DOWNSAMPLE_MODE = 'random'
+
+# Tamaño de la celda (vóxel) en metros para los modos 'voxel' y 'heightmap'
+VOXEL_SIZE = 0.25
+
 # Tamaño de la ventana de visualización (en píxeles)
 WINDOW_WIDTH = 1400
 WINDOW_HEIGHT = 900
@@ -49,6 +63,13 @@ POINT_SIZE = 1  # Ajusta según preferencia (0.5 - 3)
 # Rango RGB típico en archivos LAS (0-65535)
 RGB_MAX_VALUE = 65535
 
+# Puntos por bloque al muestrear colores de la ortofotografía
+RGB_SAMPLING_CHUNK_SIZE = 1_000_000
+
+# Colores considerados "sin datos" (0xRRGGBB, tras escalar a 8 bits); se pintan en gris
+# Ejemplo: [0x000000, 0xFFFFFF] para excluir también el blanco saturado
+RGB_NODATA_VALUES = [0x000000]
+
 # Mapa de colores para visualización por altura (si no hay RGB)
 # Opciones: 'Viridis', 'Plasma', 'Inferno', 'Magma', 'Cividis'
 #          'Turbo', 'Rainbow', 'Jet', 'Earth', 'Electric', 'Portland'
@@ -69,6 +90,17 @@ FILTER_BY_CLASSIFICATION = False  # Cambia a True para filtrar solo vegetación
 # Si FILTER_BY_CLASSIFICATION = True, qué clases mostrar
 CLASSES_TO_SHOW = VEGETATION_CLASSES  # Cambia a [2] para solo suelo, etc.
 
+# Ventana XY a visualizar en coordenadas del LAS: (xmin, ymin, xmax, ymax)
+# None = visualizar toda la nube. Usa un índice espacial KD-tree (requiere scipy)
+VIEW_WINDOW = None
+
+# Carpeta de caché (índices espaciales y puntos LAS/LAZ ya decodificados)
+CACHE_DIR = os.path.join(BASE_DIR, 'cache')
+
+# Reutilizar los puntos decodificados y el índice espacial de ejecuciones anteriores
+# (se invalida si cambia el archivo o los parámetros de carga; ver --no-cache)
+USE_CACHE = True
+
 # ============================================================
 # CONFIGURACIÓN DE NORMALIZACIÓN
 # ============================================================
@@ -93,6 +125,12 @@ HTML_OUTPUT_PATH = os.path.join(BASE_DIR, 'visualizacion_lidar.html')
 # Tema de la visualización
 PLOT_THEME = 'plotly_dark'  # Opciones: 'plotly', 'plotly_white', 'plotly_dark'
 
+# Motor de renderizado: 'scatter3d' (Plotly) o 'deckgl' (deck.gl, HTML propio)
+# deck.gl usa WebGL nativo y se mantiene fluido con millones de puntos
+RENDER_BACKEND = 'scatter3d'
+# El HTML de deck.gl se escribe siempre (aunque SAVE_HTML sea False): es el archivo que se abre
+DECKGL_HTML_OUTPUT_PATH = os.path.join(BASE_DIR, 'visualizacion_lidar_deckgl.html')
+
 # ============================================================
 # MENSAJES Y LOGS
 # ============================================================
@@ -139,15 +177,19 @@ def print_config_summary():
     print("CONFIGURACIÓN ACTUAL")
     print(f"{'='*60}")
     print(f"Archivo a visualizar: {LAZ_FILE}")
-    print(f"Puntos máximos: {MAX_POINTS_VISUALIZATION:,}")
+    print(f"Puntos máximos: {f'{MAX_POINTS_VISUALIZATION:,}' if MAX_POINTS_VISUALIZATION is not None else 'Todos'}")
     print(f"Tamaño de punto: {POINT_SIZE}")
+    print(f"Reducción de puntos: {DOWNSAMPLE_MODE}" + (f" ({VOXEL_SIZE} m)" if DOWNSAMPLE_MODE != 'random' else ""))
     print(f"Mapa de colores: {HEIGHT_COLORMAP}")
     print(f"Normalizar altura: {'✓' if NORMALIZE_HEIGHT else '✗'}")
     print(f"Centrar coordenadas: {'✓' if CENTER_COORDINATES else '✗'}")
     print(f"Filtrar por clasificación: {'✓' if FILTER_BY_CLASSIFICATION else '✗'}")
     if FILTER_BY_CLASSIFICATION:
         print(f"Clases a mostrar: {CLASSES_TO_SHOW}")
+    print(f"Ventana espacial: {VIEW_WINDOW if VIEW_WINDOW is not None else 'Toda la nube'}")
+    print(f"Motor de renderizado: {RENDER_BACKEND}")
     print(f"Guardar HTML: {'✓' if SAVE_HTML else '✗'}")
+    print(f"Usar caché: {'✓' if USE_CACHE else '✗'}")
     print(f"{'='*60}\n")
 
 